@@ -9,6 +9,15 @@ STATE_FILE    = os.getenv("AI_STATE_FILE", "/data/ai_state.json")
 PAYOUT_SCALE  = float(os.getenv("PAYOUT_SCALE", "1200"))
 # Initial exploration (can decay after wins)
 INIT_EXPLORE  = float(os.getenv("AI_EXPLORATION", "0.05"))
+# Per-regime weights written by ai_train.py (falls back to DEFAULT_WEIGHTS)
+WEIGHTS_FILE  = os.getenv("AI_WEIGHTS_FILE", "/data/ai_weights.json")
+
+FEATURES = ("ema_spread", "ema_slope", "htf_align", "vol_norm")
+# hand-tuned coefficients; "bias" is the prior used before any rewards arrive
+DEFAULT_WEIGHTS = {"bias": 0.55, "ema_spread": 0.10, "ema_slope": 0.06, "htf_align": 0.05, "vol_norm": 0.02}
+# features the hand-tuned model scores (AI_MIN_SCORE was tuned without
+# htf_align/vol_norm); a trained model lists its own under "features"
+DEFAULT_FEATURES = ("ema_spread", "ema_slope")
 
 _lock = threading.Lock()
 
@@ -27,44 +36,89 @@ _state = {
     "caution_multiplier": 1.0,  # >1 => stricter gating for a while
 }
 
+_state_mtime = None   # mtime_ns of STATE_FILE as last loaded/saved by this process
+
 def _load_state():
+    global _state_mtime
     try:
+        mtime = os.stat(STATE_FILE).st_mtime_ns
         with open(STATE_FILE, "r") as f:
             _state.update(json.load(f))
+        _state_mtime = mtime
     except Exception:
         pass
 
+def _refresh_state():
+    """
+    Re-read STATE_FILE if another process (the background leader) rewrote it,
+    so web workers gate /scan with the current caution and exploration.
+    """
+    try:
+        mtime = os.stat(STATE_FILE).st_mtime_ns
+    except Exception:
+        return
+    if mtime != _state_mtime:
+        with _lock:
+            _load_state()
+
 def _save_state():
+    global _state_mtime
     try:
-        tmp = STATE_FILE + ".tmp"
+        tmp = f"{STATE_FILE}.{os.getpid()}.tmp"
         with open(tmp, "w") as f:
             json.dump(_state, f)
         os.replace(tmp, STATE_FILE)
+        _state_mtime = os.stat(STATE_FILE).st_mtime_ns
     except Exception:
         pass
 
+# trained weights: {"version": int, "trained_at": str,
+#                   "regimes": {regime: {feature: w, "bias": b, "features": [scored features],
+#                                        "min_score": calibrated entry gate}}}
+_weights = {"version": 0, "regimes": {}}
+
+def _load_weights():
+    try:
+        with open(WEIGHTS_FILE, "r") as f:
+            data = json.load(f)
+        if isinstance(data, dict) and isinstance(data.get("regimes"), dict):
+            _weights.update(data)
+    except Exception:
+        pass
+
+def regime_weights(regime: str) -> dict:
+    w = dict(DEFAULT_WEIGHTS, features=DEFAULT_FEATURES)
+    regs = _weights.get("regimes", {})
+    fitted = regs.get(regime) or regs.get("default")
+    if fitted:
+        w.update(fitted)
+        w["features"] = tuple(k for k in fitted.get("features", FEATURES) if k in FEATURES)
+    return w
+
 _load_state()
+_load_weights()
 
 def score(features: dict, regime: str):
     """
     Returns (p, exploration). Keep features lightweight and numeric:
       ema_spread (0..1), ema_slope (−1..1), htf_align (0..1), vol_norm (0..1)
     """
+    _refresh_state()
+    w = regime_weights(regime)
     hist = _model_memory.get(regime) or []
-    prior = (sum(hist) / len(hist)) if hist else 0.55
-
-    ema_spread = float(features.get("ema_spread", 0.0))
-    ema_slope  = float(features.get("ema_slope", 0.0))
-    htf_align  = float(features.get("htf_align", 0.0))
-    vol_norm   = float(features.get("vol_norm", 0.0))
+    prior = (sum(hist) / len(hist)) if hist else w["bias"]
 
-    base = prior + 0.10*ema_spread + 0.06*ema_slope + 0.05*htf_align + 0.02*vol_norm
+    base = prior + sum(w[k] * float(features.get(k, 0.0)) for k in w["features"])
     # caution after losses makes it a bit harder to fire
     base -= 0.05 * max(0.0, _state.get("caution_multiplier", 1.0) - 1.0)
 
     p = max(0.0, min(1.0, base))
     return p, _state.get("exploration", INIT_EXPLORE)
 
+def min_score(regime: str, default: float) -> float:
+    """Entry gate for `regime`: calibrated by ai_train for a trained model, else `default`."""
+    return float(regime_weights(regime).get("min_score", default))
+
 def online_update(features: dict, regime: str, reward: float):
     # lightweight bandit-style update
     try:
@@ -116,6 +170,7 @@ def compute_reward(*,
 def register_outcome(outcome: str):
     """Adjust ‘caution’ & exploration after each trade result."""
     now = time.time()
+    _refresh_state()
     with _lock:
         _state["last_outcome_ts"] = now
         if outcome == "SL":
@@ -136,10 +191,12 @@ def register_outcome(outcome: str):
         _save_state()
 
 def ai_status():
+    _refresh_state()
     return {
         "sl_streak": int(_state.get("sl_streak", 0)),
         "caution": round(float(_state.get("caution_multiplier", 1.0)), 2),
         "explore": round(float(_state.get("exploration", INIT_EXPLORE)), 3),
         "state_file": STATE_FILE,
+        "weights_version": int(_weights.get("version", 0)),
         "payout_scale": PAYOUT_SCALE
     }
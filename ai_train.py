@@ -0,0 +1,225 @@
+# ai_train.py
+# Offline retraining of ai_core weights from stored 5m bar history.
+#   python ai_train.py --days 365            # fetch/extend history, fit, write AI_WEIGHTS_FILE
+#   python ai_train.py --bars my_5m.csv      # train from an existing CSV only
+import os, json, time, argparse
+from datetime import datetime
+from typing import Optional
+import numpy as np
+import pandas as pd
+
+from ai_core import FEATURES, DEFAULT_WEIGHTS, WEIGHTS_FILE
+from utils import (
+    mexc_fetch, compute_indicators, htf_regime_asof, ai_features,
+    strategy_indicators, evaluate_strategies, first_signal,
+    SL_CAP_BASE, TP1_DOLLARS, AI_MIN_SCORE,
+)
+
+BARS_FILE     = os.getenv("BARS_HISTORY_FILE", "bars_5m.csv")
+HORIZON_BARS  = 59      # same forward window as run_backtest (i+1 .. i+59)
+MIN_ROWS      = 200     # per regime; fewer rows keep the default weights
+MIN_ADMIT     = 0.05    # a model whose gate admits fewer training entries is not written
+PAGE_LIMIT    = 1000    # MEXC klines max per request
+
+# =========================
+# BAR HISTORY (CSV store, extended from MEXC)
+# =========================
+def load_bars(path: str = BARS_FILE) -> Optional[pd.DataFrame]:
+    try:
+        if not os.path.exists(path):
+            return None
+        df = pd.read_csv(path, index_col=0)
+        df.index = pd.to_datetime(df.index, utc=True)
+        return df[["open","high","low","close","volume"]].sort_index()
+    except Exception:
+        return None
+
+def _page_back(end_ms: Optional[int], stop_at: pd.Timestamp) -> list:
+    """MEXC 5m pages ending at `end_ms` (None = now), newest first, until `stop_at` is reached."""
+    pages = []
+    while True:
+        page = mexc_fetch("5m", limit=PAGE_LIMIT, end_ms=end_ms)
+        if page is None or page.empty:
+            break
+        page.index = page.index.tz_convert("UTC")
+        pages.append(page)
+        first = page.index[0]
+        if first <= stop_at:
+            break
+        end_ms = int(first.value // 1_000_000) - 1
+        time.sleep(0.2)   # stay well under the public rate limit
+    return pages
+
+def fetch_history(days: int, path: str = BARS_FILE) -> Optional[pd.DataFrame]:
+    """
+    Cover the last `days` of 5m bars in the CSV store: page forward from the
+    newest stored bar to now, and back from the oldest stored bar to the
+    start of the window (a store from a shorter run is extended backward).
+    """
+    have = load_bars(path)
+    want_from = pd.Timestamp.now(tz="UTC") - pd.Timedelta(days=days)
+    if have is None or have.empty:
+        pages = _page_back(None, want_from)
+    else:
+        pages = _page_back(None, have.index[-1]) + [have]
+        if have.index[0] > want_from:
+            pages += _page_back(int(have.index[0].value // 1_000_000) - 1, want_from)
+    if not pages:
+        return None
+    df = pd.concat(pages).sort_index()
+    df = df[~df.index.duplicated(keep="last")]
+    df.to_csv(path)
+    df = df.loc[df.index >= want_from]
+    if not df.empty:
+        got = (df.index[-1] - df.index[0]) / pd.Timedelta(days=1)
+        short = f" (asked for {days}; MEXC returned no older bars)" if df.index[0] - want_from > pd.Timedelta(days=1) else ""
+        print(f"ℹ️ Using {got:.1f} days of 5m history, {df.index[0]:%Y-%m-%d} → {df.index[-1]:%Y-%m-%d}{short}")
+    return df
+
+def resample_15m(df5: pd.DataFrame) -> pd.DataFrame:
+    agg = {"open": "first", "high": "max", "low": "min", "close": "last", "volume": "sum"}
+    return df5.resample("15min", label="left", closed="left").agg(agg).dropna()
+
+# =========================
+# DATASET: features + simulated trade labels
+# =========================
+def _first_true(mask: np.ndarray) -> np.ndarray:
+    """Column index of the first True per row (mask.shape[1] if none)."""
+    return np.where(mask.any(axis=1), mask.argmax(axis=1), mask.shape[1])
+
+def build_dataset(df5: pd.DataFrame, horizon: int = HORIZON_BARS):
+    """
+    Rows = 5m bars where an active strategy fires. Label = 1 if TP1 is
+    touched before SL within `horizon` bars (same-bar touch counts as SL).
+    Returns X (n, len(FEATURES)), y (n,), regimes (n,).
+    """
+    d5 = compute_indicators(df5, strategy_indicators())
+    regimes = htf_regime_asof(d5, compute_indicators(resample_15m(df5)))
+    feats = ai_features(d5, regimes)
+    X = np.column_stack([feats[k] for k in FEATURES])
+
+    close = d5["close"].to_numpy(dtype=float)
+    sides, _who = first_signal(evaluate_strategies(d5, regimes))
+    cond = sides != 0
+
+    n = len(d5) - horizon
+    if n <= 25:
+        return X[:0], np.zeros(0), regimes[:0]
+    # forward windows without copying: row i sees bars i+1 .. i+horizon
+    hi = np.lib.stride_tricks.sliding_window_view(d5["high"].to_numpy(dtype=float)[1:], horizon)[:n]
+    lo = np.lib.stride_tricks.sliding_window_view(d5["low"].to_numpy(dtype=float)[1:], horizon)[:n]
+    c  = close[:n, None]
+    long_ = (sides[:n] > 0)[:, None]
+    tp_hit = np.where(long_, hi >= c + TP1_DOLLARS, lo <= c - TP1_DOLLARS)
+    sl_hit = np.where(long_, lo <= c - SL_CAP_BASE, hi >= c + SL_CAP_BASE)
+    y = (_first_true(tp_hit) < _first_true(sl_hit)).astype(float)
+
+    rows = np.flatnonzero(cond[:n] & (np.arange(n) >= 25) & np.isfinite(X[:n]).all(axis=1))
+    return X[rows], y[rows], regimes[rows]
+
+# =========================
+# FIT (closed-form ridge on the linear score used by ai_core.score)
+# =========================
+def fit_ridge(X: np.ndarray, y: np.ndarray, lam: float = 1.0) -> dict:
+    """
+    p ≈ bias + Σ w_k x_k, solved on standardized features and mapped back to
+    raw feature units so ai_core.score can apply the weights directly.
+    """
+    mu = X.mean(axis=0)
+    sd = X.std(axis=0)
+    sd[sd < 1e-12] = 1.0
+    Z = (X - mu) / sd
+    ym = y.mean()
+    A = Z.T @ Z + lam * np.eye(Z.shape[1])
+    w = np.linalg.solve(A, Z.T @ (y - ym)) / sd
+    out = {k: float(w[j]) for j, k in enumerate(FEATURES)}
+    out["features"] = list(FEATURES)
+    out["bias"] = float(ym - w @ mu)
+    out["n"] = int(len(y))
+    out["hit_rate"] = float(ym)
+    return out
+
+def calibrated_min_score(fitted: dict, gate: float = AI_MIN_SCORE) -> float:
+    """
+    Entry gate on the trained scale. Trained p centres on the hit rate, not on
+    the 0.55 prior AI_MIN_SCORE was tuned against, so keep the gate's offset
+    from the prior: min_score = hit_rate - (default bias - AI_MIN_SCORE).
+    """
+    return float(fitted["hit_rate"] - (DEFAULT_WEIGHTS["bias"] - gate))
+
+def admit_rate(X: np.ndarray, fitted: dict) -> float:
+    """Share of rows whose score (as ai_core.score, no caution) clears fitted["min_score"]."""
+    if not len(X):
+        return 0.0
+    w = np.array([fitted[k] for k in FEATURES])
+    p = np.clip(fitted["bias"] + X @ w, 0.0, 1.0)
+    return float((p >= fitted["min_score"]).mean())
+
+def _fit_regime(X: np.ndarray, y: np.ndarray, lam: float) -> dict:
+    out = fit_ridge(X, y, lam)
+    out["min_score"] = calibrated_min_score(out)
+    out["admit_rate"] = admit_rate(X, out)
+    return out
+
+def train(df5: pd.DataFrame, lam: float = 1.0) -> dict:
+    X, y, regimes = build_dataset(df5)
+    fitted = {}
+    if len(y) >= MIN_ROWS:
+        fitted["default"] = _fit_regime(X, y, lam)
+    for reg in ("up", "down"):
+        m = regimes == reg
+        if m.sum() >= MIN_ROWS:
+            fitted[reg] = _fit_regime(X[m], y[m], lam)
+    return fitted
+
+def save_weights(regimes: dict, meta: dict, path: str = WEIGHTS_FILE) -> dict:
+    """Write a new version to `path` (read by ai_core at startup) and keep a .vN copy."""
+    version = 0
+    try:
+        with open(path, "r") as f:
+            version = int(json.load(f).get("version", 0))
+    except Exception:
+        pass
+    doc = {"version": version + 1, "trained_at": datetime.now().isoformat(timespec="seconds"),
+           "regimes": regimes, **meta}
+    root, ext = os.path.splitext(path)
+    with open(f"{root}.v{doc['version']}{ext or '.json'}", "w") as f:
+        json.dump(doc, f, indent=1)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(doc, f, indent=1)
+    os.replace(tmp, path)
+    return doc
+
+def main():
+    ap = argparse.ArgumentParser(description="Retrain ai_core weights from 5m bar history.")
+    ap.add_argument("--days", type=int, default=365)
+    ap.add_argument("--bars", default=None, help="train from this CSV only (no fetch)")
+    ap.add_argument("--lam", type=float, default=1.0, help="ridge strength")
+    ap.add_argument("--out", default=WEIGHTS_FILE)
+    a = ap.parse_args()
+
+    t0 = time.time()
+    df5 = load_bars(a.bars) if a.bars else fetch_history(a.days)
+    if df5 is None or len(df5) < 500:
+        print("❌ Not enough 5m history to train.")
+        return
+    fitted = train(df5, a.lam)
+    if not fitted:
+        print(f"ℹ️ Fewer than {MIN_ROWS} qualifying rows; weights unchanged.")
+        return
+    shut = {reg: w["admit_rate"] for reg, w in fitted.items() if w["admit_rate"] < MIN_ADMIT}
+    if shut:
+        print(f"❌ Retrained gate admits < {MIN_ADMIT:.0%} of training entries "
+              f"({', '.join(f'{r}={a:.1%}' for r, a in shut.items())}); weights unchanged.")
+        return
+    doc = save_weights(fitted, {"bars": int(len(df5)), "from": str(df5.index[0]), "to": str(df5.index[-1])}, a.out)
+    print(f"✅ Weights v{doc['version']} → {a.out} ({len(df5)} bars, {time.time()-t0:.1f}s)")
+    for reg, w in fitted.items():
+        coefs = " ".join(f"{k}={w[k]:+.4f}" for k in ("bias",) + FEATURES)
+        print(f"  {reg}: n={w['n']} hit={w['hit_rate']:.2f} gate={w['min_score']:.3f} "
+              f"admits={w['admit_rate']:.0%} {coefs}")
+    print(f"(defaults: {DEFAULT_WEIGHTS})")
+
+if __name__ == "__main__":
+    main()
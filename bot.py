@@ -11,6 +11,12 @@ from utils import (
     get_bot_status,     # returns string
     get_results,        # returns string
     get_trade_logs,     # returns string
+    get_risk_report,    # returns string
+    subscribe,          # chat → symbols/alert types registry
+    unsubscribe,
+    broadcast,          # fan-out of one computed message to subscribers
+    ALERT_TYPES,
+    SYMBOL,             # the only symbol the loops scan
     start_background    # starts auto-scan + momentum pings threads
 )
 
@@ -37,16 +43,18 @@ def menu_cmd(update: Update, context: CallbackContext):
         "/status — Current logic\n"
         "/results — Win stats\n"
         "/logs — Last trades\n"
-        "/diag — Data diag"
+        "/risk — Monte Carlo risk\n"
+        "/diag — Data diag\n"
+        "/subscribe [entry momentum info error] [SYMBOL] — Get alerts\n"
+        "/unsubscribe — Stop alerts"
     )
 
 def scan_cmd(update: Update, context: CallbackContext):
-    head, detail = scan_market()
+    head, opened = scan_market()
     update.message.reply_text(head)
-    if detail:
-        # chunk long texts
-        for i in range(0, len(detail), 3500):
-            update.message.reply_text(detail[i:i+3500])
+    if opened is True:
+        # a new entry is computed once and shared with every subscriber
+        broadcast(context.bot, head, "entry", exclude=update.effective_chat.id)
 
 def forcescan_cmd(update: Update, context: CallbackContext):
     head, detail = scan_market(force=True)
@@ -71,6 +79,26 @@ def results_cmd(update: Update, context: CallbackContext):
 def logs_cmd(update: Update, context: CallbackContext):
     update.message.reply_text(get_trade_logs())
 
+def risk_cmd(update: Update, context: CallbackContext):
+    update.message.reply_text(get_risk_report())
+
+def subscribe_cmd(update: Update, context: CallbackContext):
+    args = [a.lower() for a in (context.args or [])]
+    alerts  = [a for a in args if a in ALERT_TYPES]
+    symbols = [a.upper() for a in args if a not in ALERT_TYPES]
+    unknown = [a for a in symbols if a != SYMBOL]
+    if unknown:
+        # a typo would otherwise replace the symbol and the chat would never get an alert
+        update.message.reply_text(f"❓ Unknown: {', '.join(unknown)}. "
+                                  f"Alerts: {' '.join(ALERT_TYPES)} | Symbols: {SYMBOL}")
+        return
+    sub = subscribe(update.effective_chat.id, symbols=symbols, alerts=alerts)
+    update.message.reply_text(f"🔔 Subscribed: {', '.join(sub['symbols'])} | {', '.join(sub['alerts'])}")
+
+def unsubscribe_cmd(update: Update, context: CallbackContext):
+    ok = unsubscribe(update.effective_chat.id)
+    update.message.reply_text("🔕 Unsubscribed." if ok else "ℹ️ Not subscribed.")
+
 def diag_cmd(update: Update, context: CallbackContext):
     update.message.reply_text(diag_data())
 
@@ -83,7 +111,16 @@ dispatcher.add_handler(CommandHandler("backtest", backtest_cmd))
 dispatcher.add_handler(CommandHandler("status", status_cmd))
 dispatcher.add_handler(CommandHandler("results", results_cmd))
 dispatcher.add_handler(CommandHandler("logs", logs_cmd))
+dispatcher.add_handler(CommandHandler("risk", risk_cmd))
 dispatcher.add_handler(CommandHandler("diag", diag_cmd))
+dispatcher.add_handler(CommandHandler("subscribe", subscribe_cmd))
+dispatcher.add_handler(CommandHandler("unsubscribe", unsubscribe_cmd))
+
+# Under a multi-worker server (e.g. gunicorn bot:app, without --preload) main()
+# never runs: each worker joins the background leader election on import and
+# only the elected process runs the scan/momentum loops.
+if __name__ != "__main__":
+    start_background(bot)
 
 # webhook endpoint
 @app.route(f"/{TOKEN}", methods=["POST"])
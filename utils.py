@@ -1,11 +1,19 @@
 # utils.py
-import os, json, time, math
+import os, json, time, math, threading, uuid, queue
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
 from typing import Optional, Tuple
 import requests
 import pandas as pd
 import numpy as np
 
+try:
+    import fcntl   # POSIX file locks (shared state + background leader election)
+except Exception:  # non-POSIX: fall back to single-process behaviour
+    fcntl = None
+
 # =========================
 # HARD-CODED HISTORY LIMITS
 # =========================
@@ -43,9 +51,17 @@ RSI_MAX             = int(os.getenv("RSI_MAX", "75"))
 # Data / logs / tz
 SYMBOL              = os.getenv("SYMBOL", "BTCUSDT")
 TRADE_LOG_FILE      = os.getenv("TRADE_LOG_FILE", "trade_logs.json")
-OPEN_TRADE_FILE     = os.getenv("OPEN_TRADE_FILE", "open_trade.json")   # new file to store current open idea
+OPEN_TRADE_FILE     = os.getenv("OPEN_TRADE_FILE", "open_trade.json")   # position book (all open trades)
+MAX_OPEN_POSITIONS  = int(os.getenv("MAX_OPEN_POSITIONS", "1"))         # across the whole book
+MAX_POSITIONS_PER_SIDE = int(os.getenv("MAX_POSITIONS_PER_SIDE", "1"))  # per symbol + side
 TZ                  = os.getenv("TZ_NAME", "Asia/Kolkata")
 
+# Cross-process coordination (multiple web workers on one host)
+SUBSCRIBERS_FILE    = os.getenv("SUBSCRIBERS_FILE", "subscribers.json")
+STATE_LOCK_FILE     = os.getenv("STATE_LOCK_FILE", "state.lock")        # guards open-trade + journal writes
+LEADER_LOCK_FILE    = os.getenv("LEADER_LOCK_FILE", "bg_leader.lock")   # holder runs the market loops
+LEADER_POLL_SEC     = int(os.getenv("LEADER_POLL_SEC", "5"))            # standby re-check (failover delay)
+
 # Momentum ping cadence (bot side can call momentum_pulse() every ~60s)
 PING_COOLDOWN_SEC_1M = 50
 PING_COOLDOWN_SEC_5M = 50
@@ -55,6 +71,7 @@ PING_COOLDOWN_SEC_5M = 50
 # =========================
 def _noop_reward(**kwargs): return 0.0
 def _noop_register(_): pass
+def _default_min_score(regime: str, default: float) -> float: return default
 def _fallback_ai_score(features: dict, regime: str):
     # simple, stable scorer
     spread = features.get("ema_spread", 0.0)   # (ema5-ema20)/close
@@ -63,11 +80,12 @@ def _fallback_ai_score(features: dict, regime: str):
     return max(0.0, min(1.0, float(base))), 0.05
 
 try:
-    from ai_core import score as ai_score_model, compute_reward, register_outcome
+    from ai_core import score as ai_score_model, compute_reward, register_outcome, min_score as ai_min_score
 except Exception:
     ai_score_model = _fallback_ai_score
     compute_reward = _noop_reward
     register_outcome = _noop_register
+    ai_min_score = _default_min_score
 
 # =========================
 # MEXC v3 spot klines fetch
@@ -75,16 +93,126 @@ except Exception:
 MEXC_V3_URL = "https://api.mexc.com/api/v3/klines"
 _MEXC_TF_MAP = {"1m":"1m","5m":"5m","15m":"15m","30m":"30m","1h":"1h"}
 
-def mexc_fetch(tf: str, limit: int = 200) -> Optional[pd.DataFrame]:
+MEXC_TIMEOUT_SEC     = float(os.getenv("MEXC_TIMEOUT_SEC", "12"))
+BREAKER_FAILS        = int(os.getenv("BREAKER_FAILS", "3"))             # consecutive failures → open
+BREAKER_COOLDOWN_SEC = float(os.getenv("BREAKER_COOLDOWN_SEC", "30"))   # open → one half-open probe
+STALE_MAX_AGE_SEC    = float(os.getenv("STALE_MAX_AGE_SEC", "900"))     # oldest cached bars we serve
+
+# circuit breaker: closed (normal) → open (fail fast, serve cache) → half_open (one probe)
+_breaker = {"state": "closed", "fails": 0, "opened_at": 0.0, "down_since": 0.0, "probing": False}
+_breaker_lock = threading.Lock()
+_breaker_alerts = deque(maxlen=20)  # one message per state change, drained by the leader's loops
+_bar_cache = {}                  # (symbol, tf) → (fetched_at, last good DataFrame)
+
+def _queue_breaker_alert(text: str):
+    # only the background leader drains alerts; other workers would just accumulate them
+    if is_bg_leader():
+        _breaker_alerts.append(text)
+
+def _breaker_set(state: str):
+    # caller holds _breaker_lock
+    prev, now = _breaker["state"], time.time()
+    if prev == state:
+        return
+    if state == "open":
+        _breaker["opened_at"] = now          # cooldown restarts after every failed probe
+        if prev == "closed":
+            _breaker["down_since"] = now
+            _queue_breaker_alert(f"⚠️ MEXC degraded ({_breaker['fails']} failed fetches) — "
+                                 "serving cached bars, no new entries.")
+    elif state == "closed" and prev != "closed":
+        _queue_breaker_alert(f"✅ MEXC recovered after {now - _breaker['down_since']:.0f}s.")
+    _breaker["state"] = state
+
+def _breaker_allow() -> bool:
+    with _breaker_lock:
+        if _breaker["state"] == "closed":
+            return True
+        if _breaker["state"] == "open" and time.time() - _breaker["opened_at"] >= BREAKER_COOLDOWN_SEC \
+                and not _breaker["probing"]:
+            _breaker_set("half_open")
+            _breaker["probing"] = True
+            return True
+        return False
+
+def _breaker_result(ok: bool):
+    with _breaker_lock:
+        _breaker["probing"] = False
+        if ok:
+            _breaker["fails"] = 0
+            _breaker_set("closed")
+            return
+        _breaker["fails"] += 1
+        if _breaker["state"] == "half_open" or _breaker["fails"] >= BREAKER_FAILS:
+            _breaker_set("open")
+
+def breaker_state() -> str:
+    return _breaker["state"]
+
+def data_degraded() -> bool:
+    return _breaker["state"] != "closed" or _breaker["fails"] > 0
+
+def pop_data_alerts() -> list:
+    with _breaker_lock:
+        out = list(_breaker_alerts)
+        _breaker_alerts.clear()
+    return out
+
+def bars_age(df: Optional[pd.DataFrame]) -> float:
+    """Seconds since a frame was fetched (0 for fresh bars, >0 for cached fallbacks)."""
+    return 0.0 if df is None else float(df.attrs.get("stale_sec", 0.0))
+
+def _cache_bars(key: tuple, df: pd.DataFrame):
+    # merge so a short fetch (e.g. limit=2) doesn't shrink the fallback history
+    hit = _bar_cache.get(key)
+    if hit is not None:
+        both = pd.concat([hit[1], df])
+        df = both[~both.index.duplicated(keep="last")].sort_index().tail(1000)
+    _bar_cache[key] = (time.time(), df)
+
+def _cached_bars(key: tuple, limit: int) -> Optional[pd.DataFrame]:
+    hit = _bar_cache.get(key)
+    if hit is None:
+        return None
+    age = time.time() - hit[0]
+    if age > STALE_MAX_AGE_SEC:
+        return None
+    df = hit[1].tail(int(limit)).copy()
+    df.attrs["stale_sec"] = age
+    return df
+
+def mexc_fetch(tf: str, limit: int = 200, end_ms: Optional[int] = None,
+               symbol: Optional[str] = None) -> Optional[pd.DataFrame]:
+    """
+    MEXC klines behind a circuit breaker. After BREAKER_FAILS consecutive
+    failures requests fail fast; one probe is let through every
+    BREAKER_COOLDOWN_SEC. While degraded, the last good bars for `tf` are
+    returned with their age in df.attrs["stale_sec"] (see bars_age()).
+    History pages (`end_ms`) are never served from cache.
+    """
+    key = ((symbol or SYMBOL).upper(), tf)
+    if _breaker_allow():
+        df = _mexc_fetch_raw(tf, limit, end_ms, key[0])
+        _breaker_result(df is not None)
+        if df is not None:
+            if end_ms is None:
+                _cache_bars(key, df)
+            return df
+    return None if end_ms is not None else _cached_bars(key, limit)
+
+def _mexc_fetch_raw(tf: str, limit: int = 200, end_ms: Optional[int] = None,
+                    symbol: Optional[str] = None) -> Optional[pd.DataFrame]:
     """
     Robust MEXC v3 klines fetcher (spot). Returns DataFrame with:
     index = open_time (Asia/Kolkata), columns = open, high, low, close, volume
-    Handles 8–12 column array responses.
+    Handles 8–12 column array responses. `end_ms` pages back through history.
     """
     try:
         iv = _MEXC_TF_MAP.get(tf, tf)
-        params = {"symbol": SYMBOL, "interval": iv, "limit": int(limit)}
-        r = requests.get(MEXC_V3_URL, params=params, timeout=12)
+        params = {"symbol": symbol or SYMBOL, "interval": iv, "limit": int(limit)}
+        if end_ms is not None:
+            params["endTime"] = int(end_ms)
+        r = requests.get(MEXC_V3_URL, params=params, timeout=MEXC_TIMEOUT_SEC)
         if r.status_code != 200:
             return None
         data = r.json()
@@ -112,21 +240,93 @@ def mexc_fetch(tf: str, limit: int = 200) -> Optional[pd.DataFrame]:
     except Exception:
         return None
 
+# =========================
+# BATCHED FETCH (one round-trip per tick)
+# =========================
+FETCH_WORKERS = int(os.getenv("FETCH_WORKERS", "6"))
+
+_fetch_pool = None
+_inflight = {}                 # (symbol, tf) → (limit, Future) shared by concurrent callers
+_inflight_lock = threading.RLock()   # done-callbacks may fire inline while held
+
+def mexc_fetch_many(reqs) -> dict:
+    """
+    Fetch a batch of (symbol, tf, limit) requests concurrently on a bounded
+    pool. Requests for the same (symbol, tf) collapse into one call at the
+    largest limit (also across threads while a call is in flight); each
+    caller gets a tail(limit) view. Returns {(symbol, tf, limit): df or None}.
+    """
+    global _fetch_pool
+    reqs = [((sym or SYMBOL).upper(), tf, int(lim)) for sym, tf, lim in reqs]
+    want = {}
+    for sym, tf, lim in reqs:
+        want[(sym, tf)] = max(want.get((sym, tf), 0), lim)
+
+    futs = {}
+    with _inflight_lock:
+        if _fetch_pool is None:
+            _fetch_pool = ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix="mexc")
+        for key, lim in want.items():
+            cur = _inflight.get(key)
+            if cur is not None and cur[0] >= lim and not cur[1].done():
+                futs[key] = cur[1]
+                continue
+            fut = _fetch_pool.submit(mexc_fetch, key[1], lim, None, key[0])
+            _inflight[key] = (lim, fut)
+            fut.add_done_callback(lambda f, key=key: _inflight_done(key, f))
+            futs[key] = fut
+
+    got = {}
+    for key, fut in futs.items():
+        try:
+            got[key] = fut.result()
+        except Exception:
+            got[key] = None
+    out = {}
+    for sym, tf, lim in reqs:
+        df = got[(sym, tf)]
+        out[(sym, tf, lim)] = None if df is None else df.tail(lim)
+    return out
+
+def _inflight_done(key: tuple, fut):
+    with _inflight_lock:
+        cur = _inflight.get(key)
+        if cur is not None and cur[1] is fut:
+            del _inflight[key]
+
+def _fetch_tfs(*tf_limits) -> list:
+    """Convenience: batch (tf, limit) pairs for SYMBOL, results in the same order."""
+    res = mexc_fetch_many([(SYMBOL, tf, lim) for tf, lim in tf_limits])
+    return [res[(SYMBOL.upper(), tf, int(lim))] for tf, lim in tf_limits]
+
 # =========================
 # INDICATORS & HELPERS
 # =========================
-def compute_indicators(df: pd.DataFrame) -> pd.DataFrame:
-    d = df.copy()
-    d["ema5"]  = d["close"].ewm(span=5,  adjust=False).mean()
-    d["ema20"] = d["close"].ewm(span=20, adjust=False).mean()
+def _ind_vwap(d: pd.DataFrame) -> pd.Series:
     vv = d["volume"].replace(0, np.nan)
-    d["vwap"] = (d["close"] * d["volume"]).cumsum() / vv.cumsum()
-    # RSI(14)
+    return (d["close"] * d["volume"]).cumsum() / vv.cumsum()
+
+def _ind_rsi14(d: pd.DataFrame) -> pd.Series:
     delta = d["close"].diff()
     gain  = delta.clip(lower=0).ewm(alpha=1/14, adjust=False).mean()
     loss  = (-delta.clip(upper=0)).ewm(alpha=1/14, adjust=False).mean()
     rs    = gain / loss.replace(0, np.nan)
-    d["rsi"] = 100 - 100/(1 + rs)
+    return 100 - 100/(1 + rs)
+
+# name → column builder; strategies declare which of these they need
+INDICATORS = {
+    "ema5":  lambda d: d["close"].ewm(span=5,  adjust=False).mean(),
+    "ema20": lambda d: d["close"].ewm(span=20, adjust=False).mean(),
+    "vwap":  _ind_vwap,
+    "rsi":   _ind_rsi14,
+}
+
+def compute_indicators(df: pd.DataFrame, names=None) -> pd.DataFrame:
+    """Add indicator columns (all of INDICATORS by default), each computed once."""
+    d = df.copy()
+    for name in (names or INDICATORS):
+        if name not in d.columns:
+            d[name] = INDICATORS[name](d)
     return d
 
 def htf_trend(df15: pd.DataFrame) -> str:
@@ -135,31 +335,247 @@ def htf_trend(df15: pd.DataFrame) -> str:
         return "range"
     return "up" if d["close"].iloc[-1] > d["ema20"].iloc[-1] else "down"
 
+# =========================
+# HTF REGIME AS-OF INDEX (per-bar, no look-ahead)
+# =========================
+_TF_SECONDS = {"1m": 60, "5m": 300, "15m": 900, "30m": 1800, "1h": 3600}
+
+def htf_regime_series(df15: pd.DataFrame) -> np.ndarray:
+    """
+    Regime of every HTF bar ("up"/"down"/"range"), EMA20 computed once over
+    the full series. Same rule as htf_trend(), applied to each bar.
+    """
+    d = df15 if "ema20" in df15.columns else compute_indicators(df15)
+    close = d["close"].to_numpy(dtype=float)
+    ema20 = d["ema20"].to_numpy(dtype=float)
+    reg = np.where(close > ema20, "up", "down").astype(object)
+    reg[:19] = "range"   # htf_trend needs >= 20 bars
+    return reg
+
+def htf_asof_index(ltf_index: pd.DatetimeIndex, htf_index: pd.DatetimeIndex,
+                   ltf: str = "5m", htf: str = "15m") -> np.ndarray:
+    """
+    For each lower-TF bar: position of the last HTF bar that had CLOSED by the
+    time the lower-TF bar closed (-1 if none yet). Index values are open times.
+    """
+    # asi8 counts in each index's own unit (pandas 2 keeps ms/s indexes as-is)
+    ltf_close = (ltf_index + pd.Timedelta(seconds=_TF_SECONDS[ltf])).as_unit("ns").asi8
+    htf_close = (htf_index + pd.Timedelta(seconds=_TF_SECONDS[htf])).as_unit("ns").asi8
+    return np.searchsorted(htf_close, ltf_close, side="right") - 1
+
+def htf_regime_asof(d5: pd.DataFrame, df15: pd.DataFrame,
+                    ltf: str = "5m", htf: str = "15m") -> np.ndarray:
+    """
+    Per-bar regime for a lower-TF frame, aligned to the last closed HTF bar.
+    Precompute once; per-bar lookup in a replay loop is then regimes[i].
+    """
+    reg = htf_regime_series(df15)
+    pos = htf_asof_index(d5.index, df15.index, ltf, htf)
+    out = np.full(len(pos), "range", dtype=object)
+    ok = pos >= 0
+    out[ok] = reg[pos[ok]]
+    return out
+
+def ai_features(d: pd.DataFrame, regimes) -> dict:
+    """
+    Vectorized ai_core features for every bar of an indicator frame.
+    `regimes` is a per-bar array (or one string for the whole frame).
+    Shared by live scan, backtest and offline training so they score alike.
+    """
+    close = d["close"].to_numpy(dtype=float)
+    ema5  = d["ema5"].to_numpy(dtype=float)
+    ema20 = d["ema20"].to_numpy(dtype=float)
+    denom = np.maximum(1.0, close)
+    spread = (ema5 - ema20) / denom
+    slope  = np.zeros(len(d))
+    slope[4:] = (ema20[4:] - ema20[:-4]) / np.maximum(1.0, 4.0*close[4:])
+    reg = np.broadcast_to(np.asarray(regimes, dtype=object), (len(d),))
+    align = np.where(reg == "up", ema5 > ema20, np.where(reg == "down", ema5 < ema20, False)).astype(float)
+    vol = d["volume"].to_numpy(dtype=float)
+    vavg = d["volume"].rolling(20, min_periods=1).mean().to_numpy(dtype=float)
+    vol_norm = np.clip(vol / np.maximum(1e-9, 2.0*vavg), 0.0, 1.0)
+    return {"ema_spread": spread, "ema_slope": slope, "htf_align": align, "vol_norm": vol_norm}
+
+# =========================
+# STRATEGIES (plugins evaluated together over one indicator frame)
+# =========================
+# name → {"requires": (indicator names...), "gates": (gate names...), "fn": fn(d, regimes) -> int8 array}
+# fn returns, for EVERY bar, +1 (long), -1 (short) or 0 (no entry); gates then
+# veto entries so scans can report which check blocked a bar.
+STRATEGIES = {}
+ACTIVE_STRATEGIES = [x.strip() for x in os.getenv("STRATEGIES", "vwap_ema_rsi").split(",") if x.strip()]
+_AI_FEATURE_INDICATORS = ("ema5", "ema20")
+
+def _gate_rsi(d: pd.DataFrame) -> np.ndarray:
+    # optional RSI band; True where an entry is allowed
+    if not USE_RSI:
+        return np.ones(len(d), dtype=bool)
+    rsi = d["rsi"].to_numpy(dtype=float)
+    return (rsi >= RSI_MIN) & (rsi <= RSI_MAX)
+
+# gate name → {"requires": (indicator names...), "fn": fn(d) -> bool array}
+GATES = {
+    "rsi": {"requires": ("rsi",), "fn": _gate_rsi},
+}
+
+def register_strategy(name: str, requires=(), gates=()):
+    def _wrap(fn):
+        STRATEGIES[name] = {"requires": tuple(requires), "gates": tuple(gates), "fn": fn}
+        return fn
+    return _wrap
+
+@register_strategy("vwap_ema_rsi", requires=("ema5", "ema20", "vwap"), gates=("rsi",))
+def _strat_vwap_ema_rsi(d: pd.DataFrame, regimes) -> np.ndarray:
+    # with the HTF regime: close vs VWAP + EMA5/EMA20 stack (RSI band via the "rsi" gate)
+    reg = np.broadcast_to(np.asarray(regimes, dtype=object), (len(d),))
+    close, vwap = d["close"].to_numpy(dtype=float), d["vwap"].to_numpy(dtype=float)
+    ema5, ema20 = d["ema5"].to_numpy(dtype=float), d["ema20"].to_numpy(dtype=float)
+    long_  = (reg == "up")   & (close > vwap) & (ema5 > ema20)
+    short_ = (reg == "down") & (close < vwap) & (ema5 < ema20)
+    return long_.astype(np.int8) - short_.astype(np.int8)
+
+@register_strategy("ema_cross", requires=("ema5", "ema20"), gates=("rsi",))
+def _strat_ema_cross(d: pd.DataFrame, regimes) -> np.ndarray:
+    # EMA5 crossing EMA20 on this bar, in the direction of the HTF regime
+    reg = np.broadcast_to(np.asarray(regimes, dtype=object), (len(d),))
+    above = d["ema5"].to_numpy(dtype=float) > d["ema20"].to_numpy(dtype=float)
+    prev = np.r_[above[:1], above[:-1]]
+    long_  = (reg == "up")   & above & ~prev
+    short_ = (reg == "down") & ~above & prev
+    return long_.astype(np.int8) - short_.astype(np.int8)
+
+# fail at startup, not inside every scan, on a misspelt STRATEGIES env
+if not ACTIVE_STRATEGIES or any(x not in STRATEGIES for x in ACTIVE_STRATEGIES):
+    raise ValueError(f"STRATEGIES={','.join(ACTIVE_STRATEGIES) or '(empty)'}: "
+                     f"expected a comma-separated list of {', '.join(STRATEGIES)}")
+
+def strategy_indicators(names=None) -> list:
+    """Union of indicators needed by `names` (default: ACTIVE_STRATEGIES) and their gates, plus AI features."""
+    need = list(_AI_FEATURE_INDICATORS)
+    for name in (names or ACTIVE_STRATEGIES):
+        reqs = STRATEGIES[name]["requires"] + sum((GATES[g]["requires"] for g in STRATEGIES[name]["gates"]), ())
+        need += [x for x in reqs if x not in need]
+    return need
+
+def evaluate_strategies(d: pd.DataFrame, regimes, names=None, blocked=None) -> dict:
+    """
+    One pass over a shared indicator frame (from compute_indicators(df,
+    strategy_indicators(names))): name → per-bar side array, after gates.
+    Pass a dict as `blocked` to get name → per-bar name of the gate that
+    vetoed a signal ("" where nothing was vetoed).
+    """
+    gate_ok = {}
+    out = {}
+    for name in (names or ACTIVE_STRATEGIES):
+        spec = STRATEGIES[name]
+        sig = np.asarray(spec["fn"](d, regimes), dtype=np.int8)
+        why = np.full(len(sig), "", dtype=object)
+        for g in spec["gates"]:
+            if g not in gate_ok:
+                gate_ok[g] = np.asarray(GATES[g]["fn"](d), dtype=bool)
+            veto = (sig != 0) & ~gate_ok[g]
+            why[veto & (why == "")] = g
+            sig = np.where(veto, 0, sig).astype(np.int8)
+        out[name] = sig
+        if blocked is not None:
+            blocked[name] = why
+    return out
+
+def first_signal(signals: dict):
+    """
+    Merge per-strategy sides: for each bar the first firing strategy (in
+    ACTIVE_STRATEGIES order) wins. Returns (side array, strategy-name array).
+    """
+    n = len(next(iter(signals.values()))) if signals else 0
+    side = np.zeros(n, dtype=np.int8)
+    who  = np.full(n, "", dtype=object)
+    for name, sig in signals.items():
+        take = (side == 0) & (sig != 0)
+        side[take] = sig[take]
+        who[take]  = name
+    return side, who
+
 def _now_iso() -> str:
     return datetime.now().isoformat(timespec="seconds")
 
 # =========================
 # OPEN TRADE STATE (persist to file)
 # =========================
-def _load_open() -> Optional[dict]:
+_state_rlock = threading.RLock()
+_state_depth = 0
+_state_fd = None
+
+@contextmanager
+def _state_lock():
+    """
+    Exclusive lock over the open-trade + journal files, shared by every process
+    on the host (flock) and re-entrant within this process.
+    """
+    global _state_depth, _state_fd
+    with _state_rlock:
+        if _state_depth == 0 and fcntl is not None:
+            try:
+                _state_fd = open(STATE_LOCK_FILE, "a")
+                fcntl.flock(_state_fd, fcntl.LOCK_EX)
+            except Exception:
+                _state_fd = None
+        _state_depth += 1
+        try:
+            yield
+        finally:
+            _state_depth -= 1
+            if _state_depth == 0 and _state_fd is not None:
+                try:
+                    fcntl.flock(_state_fd, fcntl.LOCK_UN)
+                    _state_fd.close()
+                except Exception:
+                    pass
+                _state_fd = None
+
+def _atomic_dump(path: str, obj):
+    # readers in other processes never see a half-written file
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(obj, f)
+    os.replace(tmp, path)
+
+def _load_positions() -> list:
+    """Open positions (the book). A legacy single-trade file is read as a book of one."""
     try:
         if not os.path.exists(OPEN_TRADE_FILE):
-            return None
+            return []
         x = json.load(open(OPEN_TRADE_FILE, "r"))
-        return x if isinstance(x, dict) else None
+        if isinstance(x, dict) and "side" in x:
+            x.setdefault("id", None)
+            return [x]
+        rows = x.get("positions", []) if isinstance(x, dict) else []
+        return [p for p in rows if isinstance(p, dict)]
     except Exception:
-        return None
+        return []
 
-def _save_open(d: Optional[dict]):
+def _save_positions(rows: list):
     try:
-        if d is None:
+        if not rows:
             if os.path.exists(OPEN_TRADE_FILE):
                 os.remove(OPEN_TRADE_FILE)
             return
-        json.dump(d, open(OPEN_TRADE_FILE, "w"))
+        _atomic_dump(OPEN_TRADE_FILE, {"positions": rows})
     except Exception:
         pass
 
+def _update_positions(changed: list):
+    """Write back positions by id; ones closed meanwhile are not resurrected."""
+    if not changed:
+        return
+    by_id = {p.get("id"): p for p in changed}
+    with _state_lock():
+        book = _load_positions()
+        _save_positions([by_id.get(p.get("id"), p) for p in book])
+
+def _book_room(book: list, symbol: str, side: str) -> bool:
+    same = sum(1 for p in book if p.get("side") == side and p.get("symbol", SYMBOL) == symbol)
+    return len(book) < MAX_OPEN_POSITIONS and same < MAX_POSITIONS_PER_SIDE
+
 def _load_logs() -> list:
     try:
         if not os.path.exists(TRADE_LOG_FILE):
@@ -171,14 +587,15 @@ def _load_logs() -> list:
 
 def _save_logs(rows: list):
     try:
-        json.dump(rows, open(TRADE_LOG_FILE, "w"))
+        _atomic_dump(TRADE_LOG_FILE, rows)
     except Exception:
         pass
 
 def record_trade(entry: dict) -> None:
-    rows = _load_logs()
-    rows.append(entry)
-    _save_logs(rows)
+    with _state_lock():
+        rows = _load_logs()
+        rows.append(entry)
+        _save_logs(rows)
 
 # =========================
 # ENTRY FORMATTER
@@ -190,48 +607,49 @@ def _fmt_signal(side: str, px: float, sl: float, tp1: float, tp2: float, src="ME
 # =========================
 # LIVE SCAN (used by /scan and /forcescan)
 # =========================
+def _book_full_msg(book: list) -> str:
+    last = book[-1]
+    more = f" (+{len(book)-1} more, cap {MAX_OPEN_POSITIONS})" if len(book) > 1 else ""
+    return f"ℹ️ Existing trade open: {last.get('side','').upper()} @ {last.get('entry', 0)}{more}. No new entry."
+
 def scan_market() -> Tuple[str, bool]:
-    # Block if there’s already an open trade
-    open_pos = _load_open()
-    if open_pos is not None:
-        side = open_pos.get("side","").upper()
-        e = open_pos.get("entry", 0)
-        return (f"ℹ️ Existing trade open: {side} @ {e}. No new entry.", False)
-
-    df5  = mexc_fetch("5m",  limit=FIVE_MIN_LIMIT)
-    df15 = mexc_fetch("15m", limit=FIFTEEN_MIN_LIMIT)
+    # Block once the position book is at its cap
+    book = _load_positions()
+    if len(book) >= MAX_OPEN_POSITIONS:
+        return (_book_full_msg(book), False)
+
+    df5, df15 = _fetch_tfs(("5m", FIVE_MIN_LIMIT), ("15m", FIFTEEN_MIN_LIMIT))
     if df5 is None or df5.empty or df15 is None or df15.empty:
         return ("❌ Data Error:\nNo data from MEXC.", False)
+    # the 15m regime counts too: one failed fetch serves cache before the breaker opens
+    stale = max(bars_age(df5), bars_age(df15))
+    if stale > 0:
+        return (f"⏸️ MEXC degraded — cached bars {stale:.0f}s old, no new entries.", False)
 
-    d5  = compute_indicators(df5)
+    d5  = compute_indicators(df5, strategy_indicators())
     d15 = compute_indicators(df15)
     regime = htf_trend(d15)
     if regime == "range":
         return ("ℹ️ No trade | TF 5m | Regime range", False)
 
-    last5 = d5.iloc[-1]
-    close = float(last5["close"])
+    close = float(d5["close"].iloc[-1])
 
-    # regime gate
-    if regime == "up":
-        cond = (last5["close"] > last5["vwap"]) and (last5["ema5"] > last5["ema20"])
-        side = "long"
-    else:
-        cond = (last5["close"] < last5["vwap"]) and (last5["ema5"] < last5["ema20"])
-        side = "short"
-
-    # rsi gate
-    if USE_RSI:
-        rsi_ok = RSI_MIN <= float(last5["rsi"]) <= RSI_MAX
-        if not rsi_ok:
-            return (f"ℹ️ No trade | TF 5m | Regime {regime} | RSI gate", False)
+    # all active strategies in one pass; first one firing on the last bar wins
+    blocked = {}
+    sides, who = first_signal(evaluate_strategies(d5, regime, blocked=blocked))
+    if sides[-1] == 0:
+        vetoes = [why[-1] for why in blocked.values() if why[-1]]
+        reason = f"{vetoes[0].upper()} gate" if vetoes else "No signal"
+        return (f"ℹ️ No trade | TF 5m | Regime {regime} | {reason}", False)
+    side = "long" if sides[-1] > 0 else "short"
+    strategy = who[-1]
 
     # AI score (use ai_core.score if available)
-    ema_spread = (float(last5["ema5"]) - float(last5["ema20"])) / max(1.0, close)
-    ema20_slope = (d5["ema20"].iloc[-1] - d5["ema20"].iloc[-5]) / max(1.0, 4.0*close)
-    p, _explore = ai_score_model({"ema_spread": ema_spread, "ema_slope": ema20_slope}, regime)
-    if (not cond) or (p < AI_MIN_SCORE):
-        return (f"ℹ️ No trade | TF 5m | Regime {regime} | AI {p:.2f}", False)
+    feats = ai_features(d5.iloc[-25:], regime)
+    p, _explore = ai_score_model({k: float(v[-1]) for k, v in feats.items()}, regime)
+    gate = ai_min_score(regime, AI_MIN_SCORE)
+    if p < gate:
+        return (f"ℹ️ No trade | TF 5m | Regime {regime} | AI {p:.2f} < {gate:.2f}", False)
 
     # Create trade levels
     if side == "long":
@@ -244,7 +662,9 @@ def scan_market() -> Tuple[str, bool]:
         tp2 = close - TP2_DOLLARS
 
     # Persist open trade
+    bar_ms = int(d5.index[-1:].as_unit("ms").asi8[0])
     open_pos = {
+        "id": uuid.uuid4().hex[:12],
         "symbol": SYMBOL,
         "source": "MEXC",
         "side": side,
@@ -253,25 +673,40 @@ def scan_market() -> Tuple[str, bool]:
         "tp1": float(tp1),
         "tp2": float(tp2),
         "breakeven": False,          # becomes True after TP1 is tagged
+        "strategy": strategy,
         "opened_at": _now_iso(),
+        "opened_ms": int(time.time() * 1000),
+        "bar_ms": bar_ms,            # 5m signal bar; one entry per bar and side
+        "last_bar_ms": None,         # open time of the last CLOSED 1m bar checked for exits
         "last_ping_1m": 0,
         "last_ping_5m": 0
     }
-    _save_open(open_pos)
-
-    # Log creation in trade logs (OPEN)
-    record_trade({
-        "time": _now_iso(),
-        "side": side,
-        "price": float(close),
-        "sl": float(sl),
-        "tp1": float(tp1),
-        "tp2": float(tp2),
-        "outcome": "OPEN",
-        "source": "entry"
-    })
-
-    msg = _fmt_signal(side, close, sl, tp1, tp2, "MEXC") + f"\n🤖 AI={p:.2f} | Regime={regime}"
+    with _state_lock():
+        # re-check caps: another worker may have opened a trade while we were fetching
+        book = _load_positions()
+        if len(book) >= MAX_OPEN_POSITIONS:
+            return (_book_full_msg(book), False)
+        if not _book_room(book, SYMBOL, side):
+            return (f"ℹ️ {MAX_POSITIONS_PER_SIDE} {side.upper()} trade(s) already open (per-side cap). No new entry.", False)
+        if any(x.get("bar_ms") == bar_ms and x.get("side") == side for x in book):
+            return (f"ℹ️ {side.upper()} already entered on this 5m bar. No new entry.", False)
+        _save_positions(book + [open_pos])
+
+        # Log creation in trade logs (OPEN)
+        record_trade({
+            "id": open_pos["id"],
+            "time": _now_iso(),
+            "side": side,
+            "price": float(close),
+            "sl": float(sl),
+            "tp1": float(tp1),
+            "tp2": float(tp2),
+            "outcome": "OPEN",
+            "source": "entry",
+            "strategy": strategy
+        })
+
+    msg = _fmt_signal(side, close, sl, tp1, tp2, "MEXC") + f"\n🤖 AI={p:.2f} | Regime={regime} | {strategy}"
     return (msg, True)
 
 # =========================
@@ -282,8 +717,9 @@ def _current_price_1m() -> Optional[float]:
     if d1 is None or d1.empty: return None
     return float(d1["close"].iloc[-1])
 
-def _momentum_view(tf: str) -> Optional[str]:
-    df = mexc_fetch(tf, limit=ONE_MIN_LIMIT if tf=="1m" else (FIVE_MIN_LIMIT if tf=="5m" else 200))
+def _momentum_view(tf: str, df: Optional[pd.DataFrame] = None) -> Optional[str]:
+    if df is None:
+        df = mexc_fetch(tf, limit=ONE_MIN_LIMIT if tf=="1m" else (FIVE_MIN_LIMIT if tf=="5m" else 200))
     if df is None or df.empty: return None
     d = compute_indicators(df)
     last = d.iloc[-1]
@@ -293,20 +729,22 @@ def _momentum_view(tf: str) -> Optional[str]:
     if down: return "down"
     return "mixed"
 
-def _close_trade(outcome: str, px: float):
-    # write outcome to logs & clear open file; reward the AI
-    rows = _load_logs()
-    # find last OPEN to close
-    idx = None
-    for i in range(len(rows)-1, -1, -1):
-        if rows[i].get("outcome") == "OPEN":
-            idx = i
-            break
-    if idx is not None:
-        rows[idx]["outcome"] = outcome
-        rows[idx]["exit_price"] = float(px)
-        rows[idx]["exit_time"]  = _now_iso()
-        _save_logs(rows)
+def _close_trade(outcome: str, px: float, pos_id: Optional[str] = None):
+    # write outcome to logs & drop the position from the book; reward the AI
+    with _state_lock():
+        rows = _load_logs()
+        # the journal row with this position's id (legacy rows: last OPEN)
+        idx = None
+        for i in range(len(rows)-1, -1, -1):
+            if rows[i].get("outcome") == "OPEN" and (pos_id is None or rows[i].get("id") == pos_id):
+                idx = i
+                break
+        if idx is not None:
+            rows[idx]["outcome"] = outcome
+            rows[idx]["exit_price"] = float(px)
+            rows[idx]["exit_time"]  = _now_iso()
+            _save_logs(rows)
+        _save_positions([p for p in _load_positions() if p.get("id") != pos_id])
 
     # Register outcome to AI (best-effort; we don’t have all metrics here → simple reward)
     try:
@@ -324,67 +762,69 @@ def _close_trade(outcome: str, px: float):
     except Exception:
         pass
 
-    _save_open(None)
+EXIT_MAX_1M_BARS = 1000   # MEXC page size; caps how far back one pulse can catch up
 
-def momentum_pulse() -> Optional[str]:
+def _exit_events(long_: np.ndarray, ts: np.ndarray, hi: np.ndarray, lo: np.ndarray,
+                 entry: np.ndarray, sl: np.ndarray, tp1: np.ndarray, tp2: np.ndarray,
+                 breakeven: np.ndarray, be_bar_ms: np.ndarray, since: np.ndarray,
+                 until: Optional[np.ndarray] = None) -> list:
     """
-    Call this every ~60s from your bot background thread.
-    - Moves SL→BE after TP1
-    - Suggests early book on weakness
-    - Encourages hold on strength
-    - Closes trade when SL/TP is tagged, logs outcome and notifies
-    Returns a short message (or None if no ping).
+    First-touch scan for the whole book in one pass: P positions (level
+    arrays) × T bars (oldest first; 1m live, 5m in the backtest); position k
+    only sees bars after since[k], and up to until[k] if given. Returns, per
+    position, [(event, bar_ms), ...] in order: "BE" (TP1 tagged → SL to
+    entry), then at most one of "TP2" / "SL". Within one
+    bar TP2 wins over TP1 and TP1 over SL, as the old last-candle check did;
+    after TP1 the BE stop only counts from the next bar on, while TP2 is
+    still checked on the TP1 bar (it may have been forming at the time).
     """
-    pos = _load_open()
-    if pos is None:
-        return None
-
-    now = time.time()
-    side = pos["side"]
+    P, T = len(entry), len(ts)
+    out = [[] for _ in range(P)]
+    if P == 0 or T == 0:
+        return out
+    L = long_[:, None]
+    valid = ts[None, :] > since[:, None]
+    if until is not None:
+        valid &= ts[None, :] <= until[:, None]
+    tp_hit = lambda lvl: np.where(L, hi[None, :] >= lvl[:, None], lo[None, :] <= lvl[:, None]) & valid
+    sl_hit = lambda lvl: np.where(L, lo[None, :] <= lvl[:, None], hi[None, :] >= lvl[:, None]) & valid
+    first  = lambda m: np.where(m.any(axis=1), m.argmax(axis=1), T)
+
+    # phase A: not yet at breakeven
+    fresh = ~breakeven
+    i2, i1, isl = first(tp_hit(tp2)), first(tp_hit(tp1)), first(sl_hit(sl))
+    tp2_a = fresh & (i2 < T) & (i2 <= i1) & (i2 <= isl)
+    sl_a  = fresh & ~tp2_a & (isl < i1)
+    be_a  = fresh & ~tp2_a & ~sl_a & (i1 < T)
+
+    # phase B: stop at entry from the bar after TP1; TP2 from the TP1 bar itself,
+    # since that bar may have still been forming when TP1 was tagged
+    be_ms = np.where(be_a, ts[np.minimum(i1, T - 1)], be_bar_ms)
+    stop  = np.where(be_a, entry, sl)
+    in_b  = breakeven | be_a
+    from_be = ts[None, :] >= be_ms[:, None]
+    after   = ts[None, :] > be_ms[:, None]
+    j2, jb = first(tp_hit(tp2) & from_be), first(sl_hit(stop) & after)
+    tp2_b = in_b & (j2 < T) & (j2 <= jb)
+    sl_b  = in_b & ~tp2_b & (jb < T)
+
+    for k in np.flatnonzero(tp2_a | sl_a | be_a | tp2_b | sl_b):
+        if tp2_a[k]:
+            out[k].append(("TP2", int(ts[i2[k]])))
+        elif sl_a[k]:
+            out[k].append(("SL", int(ts[isl[k]])))
+        else:
+            if be_a[k]:
+                out[k].append(("BE", int(be_ms[k])))
+            if tp2_b[k]:
+                out[k].append(("TP2", int(ts[j2[k]])))
+            elif sl_b[k]:
+                out[k].append(("SL", int(ts[jb[k]])))
+    return out
+
+def _momentum_pings(pos: dict, price: float, v1: Optional[str], v5: Optional[str], now: float) -> list:
+    side  = pos["side"]
     entry = float(pos["entry"])
-    sl   = float(pos["sl"])
-    tp1  = float(pos["tp1"])
-    tp2  = float(pos["tp2"])
-    breakeven = bool(pos.get("breakeven", False))
-
-    # latest 1m price and candle HL for tag checks
-    d1 = mexc_fetch("1m", limit=2)
-    if d1 is None or d1.empty:
-        return None
-    last = d1.iloc[-1]
-    price = float(last["close"])
-    high  = float(last["high"])
-    low   = float(last["low"])
-
-    # Check TP/SL tags first (realized outcomes)
-    if side == "long":
-        if high >= tp2:
-            _close_trade("TP2", tp2)
-            return f"🏁 TP2 HIT @ {tp2:.0f} — trade closed."
-        if high >= tp1 and not breakeven:
-            pos["breakeven"] = True
-            pos["sl"] = entry  # move to BE
-            _save_open(pos)
-            return f"🔒 Moved SL → BE @ {entry:.0f} (TP1 tagged)."
-        if low <= sl:
-            _close_trade("SL", sl)
-            return f"🛑 SL HIT @ {sl:.0f} — trade closed."
-    else:  # short
-        if low <= tp2:
-            _close_trade("TP2", tp2)
-            return f"🏁 TP2 HIT @ {tp2:.0f} — trade closed."
-        if low <= tp1 and not breakeven:
-            pos["breakeven"] = True
-            pos["sl"] = entry
-            _save_open(pos)
-            return f"🔒 Moved SL → BE @ {entry:.0f} (TP1 tagged)."
-        if high >= sl:
-            _close_trade("SL", sl)
-            return f"🛑 SL HIT @ {sl:.0f} — trade closed."
-
-    # Momentum view (1m & 5m)
-    v1 = _momentum_view("1m")
-    v5 = _momentum_view("5m")
 
     # Respect ping cooldowns
     out_msgs = []
@@ -419,122 +859,320 @@ def momentum_pulse() -> Optional[str]:
         if now - last5 > PING_COOLDOWN_SEC_5M:
             out_msgs.append("🏎️ Momentum strong — **hold toward TP2**.")
             pos["last_ping_5m"] = now
+    return out_msgs
 
-    if out_msgs:
-        _save_open(pos)
-        return "\n".join(out_msgs)
+def momentum_pulse() -> Optional[str]:
+    """
+    Call this every ~60s from your bot background thread.
+    - Checks every 1m bar since the last pulse for SL/TP1/TP2 touches,
+      for every open position in one vectorized pass
+    - Moves SL→BE after TP1
+    - Suggests early book on weakness
+    - Encourages hold on strength
+    - Closes trades when SL/TP is tagged, logs outcome and notifies
+    Returns a short message (or None if no ping).
+    """
+    book = _load_positions()
+    if not book:
+        return None
+    now = time.time()
 
-    return None
+    # every 1m bar since the last one checked, so late pulses miss no touches
+    sinces = []
+    for pos in book:
+        since = pos.get("last_bar_ms")
+        if since is None and pos.get("opened_ms"):
+            since = (int(pos["opened_ms"]) // 60000) * 60000 - 1   # include the entry minute
+        sinces.append(since)
+    known = [x for x in sinces if x is not None]
+    need = 3 if not known else int((now * 1000 - min(known)) // 60000) + 2
+    need = max(3, min(EXIT_MAX_1M_BARS, need))
+
+    # exit windows + momentum views for every symbol in one concurrent batch
+    symbols = sorted({p.get("symbol", SYMBOL).upper() for p in book})
+    lim1 = max(need, ONE_MIN_LIMIT)
+    got = mexc_fetch_many([(sym, "1m", lim1) for sym in symbols] +
+                          [(sym, "5m", FIVE_MIN_LIMIT) for sym in symbols])
+
+    tag = (lambda p: f"[{p['side'].upper()} @ {float(p['entry']):.0f}] ") if len(book) > 1 else (lambda p: "")
+    msgs, changed = [], []
+    for sym in symbols:
+        m1, m5 = got[(sym, "1m", lim1)], got[(sym, "5m", FIVE_MIN_LIMIT)]
+        if m1 is None or m1.empty:
+            continue
+        d1 = m1.tail(need)
+        price = float(d1["close"].iloc[-1])
+        ts = d1.index.as_unit("ms").asi8
+        group = [k for k, p in enumerate(book) if p.get("symbol", SYMBOL).upper() == sym]
+        legacy_since = int(ts[-3]) if len(ts) >= 3 else -1   # no timestamps: last two bars only
+        since = np.array([legacy_since if sinces[k] is None else int(sinces[k]) for k in group], dtype=np.int64)
+        col = lambda key, dflt=0.0: np.array([float(book[k].get(key) or dflt) for k in group])
+
+        # Check TP/SL tags first (realized outcomes), in the order they happened
+        events = _exit_events(
+            np.array([book[k]["side"] == "long" for k in group]), ts,
+            d1["high"].to_numpy(dtype=float), d1["low"].to_numpy(dtype=float),
+            col("entry"), col("sl"), col("tp1"), col("tp2"),
+            np.array([bool(book[k].get("breakeven", False)) for k in group]),
+            col("be_bar_ms").astype(np.int64), since)
+
+        # the still-forming last bar is re-checked next pulse
+        last_closed = int(ts[-2]) if len(ts) >= 2 else None
+        live = []
+        for k, s_k, evs in zip(group, since, events):
+            pos = book[k]
+            entry = float(pos["entry"])
+            closed = False
+            for ev, bar_ms in evs:
+                if ev == "BE":
+                    pos["breakeven"] = True
+                    pos["sl"] = entry  # move to BE
+                    pos["be_bar_ms"] = bar_ms
+                    msgs.append(f"{tag(pos)}🔒 Moved SL → BE @ {entry:.0f} (TP1 tagged).")
+                elif ev == "TP2":
+                    tp2 = float(pos["tp2"])
+                    _close_trade("TP2", tp2, pos.get("id"))
+                    msgs.append(f"{tag(pos)}🏁 TP2 HIT @ {tp2:.0f} — trade closed.")
+                    closed = True
+                else:
+                    stop = float(pos["sl"])
+                    _close_trade("SL", stop, pos.get("id"))
+                    msgs.append(f"{tag(pos)}🛑 SL HIT @ {stop:.0f} — trade closed.")
+                    closed = True
+            if closed:
+                continue
+            new_last = max(last_closed, int(s_k)) if last_closed is not None else pos.get("last_bar_ms")
+            if evs or new_last != pos.get("last_bar_ms"):
+                pos["last_bar_ms"] = new_last
+                changed.append(pos)
+            if not evs:
+                live.append(pos)
+
+        # exits above keep running on cached bars; momentum nags wait for live data
+        if bars_age(d1) > 0 or not live:
+            continue
+
+        # Momentum view (1m & 5m), once per symbol for all its positions
+        v1 = _momentum_view("1m", m1.tail(ONE_MIN_LIMIT))
+        v5 = _momentum_view("5m", m5) if m5 is not None and not m5.empty else None
+        for pos in live:
+            pings = _momentum_pings(pos, price, v1, v5, now)
+            if pings:
+                msgs += [tag(pos) + m for m in pings]
+                if not any(c is pos for c in changed):
+                    changed.append(pos)
+
+    _update_positions(changed)
+    return "\n".join(msgs) if msgs else None
 
 # =========================
 # BACKTEST (2 days default)
 # =========================
-def run_backtest(days: int = 2) -> str:
-    try:
-        df5  = mexc_fetch("5m",  limit=FIVE_MIN_LIMIT)
-        df15 = mexc_fetch("15m", limit=FIFTEEN_MIN_LIMIT)
-        if df5 is None or df5.empty or df15 is None or df15.empty:
-            return "🧪 Backtest (2d, 5m): 0 entries | Wins 0 | TP2 0 | SL 0\n(no qualifying entries)"
-
-        end = df5.index[-1]
-        start = end - pd.Timedelta(days=days)
-        d5  = compute_indicators(df5.loc[df5.index >= start])
-        d15 = compute_indicators(df15.loc[df15.index >= (end - pd.Timedelta(days=days*2))])
-        if len(d5) < 40:
-            return "🧪 Backtest (2d, 5m): 0 entries | Wins 0 | TP2 0 | SL 0\n(no qualifying entries)"
-
-        regime = htf_trend(d15)
-        if regime == "range":
-            return "🧪 Backtest (2d, 5m): 0 entries | Wins 0 | TP2 0 | SL 0\n(no qualifying entries)"
+def _backtest_trades(days: int = 2) -> list:
+    """
+    Replay the active strategies over the last `days` of 5m bars.
+    Returns one dict per simulated entry: side, price, outcome, tp1_hit,
+    breakeven (SL moved to entry), mtm ($ at the window's last close), strategy.
+    """
+    df5, df15 = _fetch_tfs(("5m", FIVE_MIN_LIMIT), ("15m", FIFTEEN_MIN_LIMIT))
+    if df5 is None or df5.empty or df15 is None or df15.empty:
+        return []
 
-        entries=wins=tp2hits=sls=0
-        lines=[]
-        for i in range(25, len(d5)-1):
-            row = d5.iloc[i]
-            close = float(row["close"])
-            if USE_RSI and not (RSI_MIN <= float(row["rsi"]) <= RSI_MAX):
-                continue
+    end = df5.index[-1]
+    start = end - pd.Timedelta(days=days)
+    d5  = compute_indicators(df5.loc[df5.index >= start], strategy_indicators())
+    if len(d5) < 40:
+        return []
 
-            if regime == "up":
-                cond = (row["close"] > row["vwap"]) and (row["ema5"] > row["ema20"])
-                side = "long"
-            else:
-                cond = (row["close"] < row["vwap"]) and (row["ema5"] < row["ema20"])
-                side = "short"
+    # regime per 5m bar from the last CLOSED 15m bar (EMA20 over the full 15m series)
+    regimes = htf_regime_asof(d5, compute_indicators(df15))
+
+    # every strategy over every bar in one pass; only signalled bars reach the loop
+    sides, who = first_signal(evaluate_strategies(d5, regimes))
+    feats = ai_features(d5, regimes)
+    closes = d5["close"].to_numpy(dtype=float)
+
+    picks = []
+    for i in np.flatnonzero(sides[25:len(d5)-1]) + 25:
+        regime = regimes[i]
+        p,_ = ai_score_model({k: float(v[i]) for k, v in feats.items()}, regime)
+        if p >= ai_min_score(regime, AI_MIN_SCORE):
+            picks.append(i)
+    if not picks:
+        return []
 
-            ema_spread = (float(row["ema5"]) - float(row["ema20"])) / max(1.0, close)
-            ema20_slope = (d5["ema20"].iloc[i] - d5["ema20"].iloc[i-4]) / max(1.0, 4.0*close)
-            p,_ = ai_score_model({"ema_spread": ema_spread, "ema_slope": ema20_slope}, regime)
-            if (not cond) or p < AI_MIN_SCORE:
-                continue
+    # first touches in time order over each entry's window (bars i+1 .. i+59),
+    # with the same TP1 → BE management as the live pulse
+    idx = np.asarray(picks)
+    long_ = sides[idx] > 0
+    sgn = np.where(long_, 1.0, -1.0)
+    entry = closes[idx]
+    last = np.minimum(idx + 59, len(d5) - 1)
+    ts = d5.index.as_unit("ms").asi8
+    events = _exit_events(long_, ts, d5["high"].to_numpy(dtype=float), d5["low"].to_numpy(dtype=float),
+                          entry, entry - sgn*SL_CAP_BASE, entry + sgn*TP1_DOLLARS, entry + sgn*TP2_DOLLARS,
+                          np.zeros(len(idx), dtype=bool), np.zeros(len(idx), dtype=np.int64),
+                          ts[idx], until=ts[last])
+
+    trades=[]
+    for k, i in enumerate(idx):
+        kinds = [ev for ev, _ in events[k]]
+        be = "BE" in kinds
+        # "TP1" = TP1 tagged, still open at BE when the window ends
+        outcome = "TP2" if "TP2" in kinds else "SL" if "SL" in kinds else "TP1" if be else "OPEN"
+        trades.append({"side": "long" if long_[k] else "short", "price": float(entry[k]),
+                       "outcome": outcome, "tp1_hit": be or outcome == "TP2", "breakeven": be,
+                       "mtm": float(sgn[k] * (closes[last[k]] - entry[k])),   # $ at window end
+                       "strategy": who[i]})
+    return trades
 
-            entries += 1
-            if side=="long":
-                sl  = close - SL_CAP_BASE
-                tp1 = close + TP1_DOLLARS
-                tp2 = close + TP2_DOLLARS
-                fwd = d5.iloc[i+1:i+60].copy()
-                hit_tp2 = (fwd["high"] >= tp2).any()
-                hit_tp1 = (fwd["high"] >= tp1).any()
-                # breakeven after TP1
-                hit_sl  = (fwd["low"] <= (close if hit_tp1 else sl)).any()
-            else:
-                sl  = close + SL_CAP_BASE
-                tp1 = close - TP1_DOLLARS
-                tp2 = close - TP2_DOLLARS
-                fwd = d5.iloc[i+1:i+60].copy()
-                hit_tp2 = (fwd["low"] <= tp2).any()
-                hit_tp1 = (fwd["low"] <= tp1).any()
-                hit_sl  = (fwd["high"] >= (close if hit_tp1 else sl)).any()
-
-            outcome="OPEN"
-            if hit_sl:
-                outcome="SL"; sls+=1
-            elif hit_tp2:
-                outcome="TP2"; tp2hits+=1; wins+=1
-            elif hit_tp1:
-                outcome="TP1"; wins+=1
-
-            if len(lines)<40:
-                lines.append(f"{entries:02d}. {side.upper()} @ {close:.0f} → {outcome}")
-
-        if entries==0:
+def run_backtest(days: int = 2) -> str:
+    try:
+        trades = _backtest_trades(days)
+        if not trades:
             return "🧪 Backtest (2d, 5m): 0 entries | Wins 0 | TP2 0 | SL 0\n(no qualifying entries)"
+        entries = len(trades)
+        wins    = sum(1 for t in trades if t["outcome"] in ("TP1","TP2"))
+        tp2hits = sum(1 for t in trades if t["outcome"] == "TP2")
+        sls     = sum(1 for t in trades if t["outcome"] == "SL")
+        tag = (lambda t: f" [{t['strategy']}]") if len(ACTIVE_STRATEGIES) > 1 else (lambda t: "")
+        lines = [f"{n:02d}. {t['side'].upper()} @ {t['price']:.0f} → {t['outcome']}{tag(t)}"
+                 for n, t in enumerate(trades[:40], start=1)]
         head = f"🧪 Backtest (2d, 5m): {entries} entries | Wins {wins} | TP2 {tp2hits} | SL {sls}"
         return head + ("\n" + "\n".join(lines) if lines else "")
     except Exception as e:
         return f"❌ Backtest error: {e}"
 
+# =========================
+# MONTE CARLO RISK (bootstrap over journal + backtest outcomes)
+# =========================
+RISK_ACCOUNT_USD  = float(os.getenv("RISK_ACCOUNT_USD", "5000"))   # ruin = equity drawdown to 0
+RISK_SIMS         = int(os.getenv("RISK_SIMS", "100000"))
+RISK_HORIZON      = int(os.getenv("RISK_HORIZON", "100"))          # trades per simulated path
+_RISK_CHUNK       = 20000                                          # sims per vectorized block
+
+def _outcome_dollars(outcome: str, breakeven: bool = False) -> Optional[float]:
+    """Map an outcome to $ PnL at the CURRENT SL/TP sizing (None = not a closed trade)."""
+    if outcome == "TP2": return TP2_DOLLARS
+    if outcome == "TP1": return TP1_DOLLARS
+    if outcome == "SL":  return 0.0 if breakeven else -SL_CAP_BASE
+    return None
+
+def _risk_samples(days: int = 2, use_backtest: bool = True) -> np.ndarray:
+    pnl = []
+    for r in _load_logs():
+        # an SL exit at the entry price is the breakeven stop after TP1
+        be = r.get("exit_price") is not None and float(r.get("exit_price")) == float(r.get("price", -1))
+        v = _outcome_dollars(r.get("outcome", "OPEN"), be)
+        if v is not None:
+            pnl.append(v)
+    if use_backtest:
+        for t in _backtest_trades(days):
+            # live management never books TP1; trades still open at the window end are marked to market
+            v = _outcome_dollars(t["outcome"], t["breakeven"]) if t["outcome"] in ("TP2", "SL") else t["mtm"]
+            pnl.append(v)
+    return np.asarray(pnl, dtype=np.float64)
+
+def monte_carlo_risk(samples: np.ndarray, sims: int = RISK_SIMS, horizon: int = RISK_HORIZON,
+                     capital: float = RISK_ACCOUNT_USD, seed: Optional[int] = None) -> Optional[dict]:
+    """
+    Bootstrap `sims` sequences of `horizon` trades from per-trade $ PnL samples.
+    Returns drawdown percentiles, risk of ruin and equity-path percentiles.
+    """
+    samples = np.asarray(samples, dtype=np.float64)
+    if samples.size == 0 or sims <= 0 or horizon <= 0:
+        return None
+    rng = np.random.default_rng(seed)
+    checkpoints = np.unique(np.linspace(1, horizon, num=min(5, horizon)).astype(int)) - 1
+
+    max_dd = np.empty(sims, dtype=np.float64)
+    ruined = np.zeros(sims, dtype=bool)
+    at_cp  = np.empty((sims, len(checkpoints)), dtype=np.float64)
+    for lo in range(0, sims, _RISK_CHUNK):
+        hi = min(sims, lo + _RISK_CHUNK)
+        eq = np.cumsum(samples[rng.integers(0, samples.size, size=(hi - lo, horizon))], axis=1)
+        peak = np.maximum.accumulate(np.maximum(eq, 0.0), axis=1)   # start equity counts as a peak
+        max_dd[lo:hi] = (peak - eq).max(axis=1)
+        ruined[lo:hi] = eq.min(axis=1) <= -capital
+        at_cp[lo:hi]  = eq[:, checkpoints]
+
+    pct = lambda x, q: float(np.percentile(x, q))
+    return {
+        "n_samples": int(samples.size),
+        "sims": int(sims),
+        "horizon": int(horizon),
+        "capital": float(capital),
+        "mean_trade": float(samples.mean()),
+        "win_rate": float((samples > 0).mean()),
+        "dd_p50": pct(max_dd, 50), "dd_p95": pct(max_dd, 95), "dd_p99": pct(max_dd, 99),
+        "risk_of_ruin": float(ruined.mean()),
+        "equity_path": [
+            {"trade": int(c) + 1,
+             "p5": pct(at_cp[:, k], 5), "p50": pct(at_cp[:, k], 50),
+             "p95": pct(at_cp[:, k], 95), "mean": float(at_cp[:, k].mean())}
+            for k, c in enumerate(checkpoints)
+        ],
+    }
+
+def get_risk_report(days: int = 2) -> str:
+    try:
+        samples = _risk_samples(days)
+        res = monte_carlo_risk(samples)
+        if res is None:
+            return "🎲 Risk: no closed trades in journal or backtest yet."
+        lines = [
+            f"🎲 Monte Carlo risk ({res['sims']:,} sims × {res['horizon']} trades, {res['n_samples']} samples)",
+            f"- Sizing: SL ${SL_CAP_BASE:.0f} | TP ${TP1_DOLLARS:.0f}/{TP2_DOLLARS:.0f} | Account ${res['capital']:.0f}",
+            f"- Win rate {res['win_rate']*100:.1f}% | E[trade] ${res['mean_trade']:.0f}",
+            f"- Max DD p50 ${res['dd_p50']:.0f} | p95 ${res['dd_p95']:.0f} | p99 ${res['dd_p99']:.0f}",
+            f"- Risk of ruin: {res['risk_of_ruin']*100:.2f}%",
+            "- Equity path (p5 / p50 / p95):",
+        ]
+        for cp in res["equity_path"]:
+            lines.append(f"  #{cp['trade']}: {cp['p5']:.0f} / {cp['p50']:.0f} / {cp['p95']:.0f}")
+        return "\n".join(lines)
+    except Exception as e:
+        return f"❌ Risk error: {e}"
+
 # =========================
 # DIAG / STATUS / RESULTS / LOGS
 # =========================
 def diag_data() -> str:
     lines=[]
-    for tf, lim in [("1m", ONE_MIN_LIMIT), ("5m", FIVE_MIN_LIMIT),
-                    ("15m", FIFTEEN_MIN_LIMIT), ("30m", THIRTY_MIN_LIMIT),
-                    ("1h", ONE_HOUR_LIMIT)]:
+    tfs = [("1m", ONE_MIN_LIMIT), ("5m", FIVE_MIN_LIMIT),
+           ("15m", FIFTEEN_MIN_LIMIT), ("30m", THIRTY_MIN_LIMIT),
+           ("1h", ONE_HOUR_LIMIT)]
+    for (tf, lim), df in zip(tfs, _fetch_tfs(*tfs)):
         try:
-            df = mexc_fetch(tf, limit=lim)
             if df is not None and not df.empty:
-                lines.append(f"{tf}: {len(df)} bars, last={df.index[-1]}")
+                stale = f" (cached {bars_age(df):.0f}s)" if bars_age(df) > 0 else ""
+                lines.append(f"{tf}: {len(df)} bars, last={df.index[-1]}{stale}")
             else:
                 lines.append(f"{tf}: None")
         except Exception as e:
             lines.append(f"{tf}: error {e}")
+    lines.append(f"breaker: {breaker_state()} (fails {_breaker['fails']})")
     return "📡 MEXC diag\n" + "\n".join(lines)
 
+def _ai_gate_text() -> str:
+    up, down = ai_min_score("up", AI_MIN_SCORE), ai_min_score("down", AI_MIN_SCORE)
+    return f"{up:.2f}" if abs(up - down) < 0.005 else f"{up:.2f} up/{down:.2f} down"
+
 def get_bot_status() -> str:
-    open_pos = _load_open()
-    open_line = "none" if open_pos is None else f'{open_pos.get("side","").upper()} @ {open_pos.get("entry")}'
+    book = _load_positions()
+    open_line = "none" if not book else ", ".join(
+        f'{p.get("side","").upper()} @ {p.get("entry")}' for p in book[:5]) + (f" (+{len(book)-5})" if len(book) > 5 else "")
     return (
         "📊 Current Logic:\n"
         f"- Exchange: MEXC, Symbol: {SYMBOL}\n"
         "- Entry TF: 5m, HTF filter: 15m\n"
-        f"- VWAP/EMA + {'RSI ' if USE_RSI else ''}AI≥{AI_MIN_SCORE:.2f}\n"
+        f"- VWAP/EMA + {'RSI ' if USE_RSI else ''}AI≥{_ai_gate_text()}\n"
         f"- $SL cap {SL_CAP_BASE:.1f}→{SL_CAP_MAX:.1f} (cushion {SL_CUSHION_DOLLARS:.1f})\n"
         f"- $TPs {TP1_DOLLARS:.1f}/{TP2_DOLLARS:.1f}\n"
         "- Momentum ping: every 60s (1m & 5m)\n"
-        f"- Open: {open_line}"
+        f"- Data: MEXC {breaker_state()}\n"
+        f"- Background loops: {'this worker' if is_bg_leader() else 'other worker'} (pid {os.getpid()})\n"
+        f"- Open ({len(book)}/{MAX_OPEN_POSITIONS}): {open_line}"
     )
 
 def get_trade_logs(n: int = 30) -> str:
@@ -557,31 +1195,171 @@ def get_results() -> str:
     wins = sum(1 for r in rows if r.get("outcome") in ("TP1","TP2"))
     tp2  = sum(1 for r in rows if r.get("outcome") == "TP2")
     sls  = sum(1 for r in rows if r.get("outcome") == "SL")
-    total = len(rows)
+    total = sum(1 for r in rows if r.get("outcome", "OPEN") != "OPEN")
     return json.dumps([total, wins, tp2, sls])
 # --- background workers (auto-scan & momentum pings) ---
 import threading, time, os
 
 __bg_started = False
+_leader_fd = None   # held open for the life of the leader process
+
+def _try_become_leader() -> bool:
+    """
+    Non-blocking exclusive flock on LEADER_LOCK_FILE. The kernel drops the lock
+    when the holder process exits, so a standby takes over on its next poll.
+    """
+    global _leader_fd
+    if _leader_fd is not None:
+        return True
+    if fcntl is None:
+        _leader_fd = True   # no cross-process locks: this process leads
+        return True
+    f = None
+    try:
+        f = open(LEADER_LOCK_FILE, "a+")
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        f.seek(0); f.truncate()
+        f.write(f"{os.getpid()} {_now_iso()}\n"); f.flush()
+        _leader_fd = f
+        return True
+    except Exception:
+        if f is not None:
+            f.close()
+        return False
+
+def is_bg_leader() -> bool:
+    return _leader_fd is not None
 
 def _chunk_text(s: str, n: int = 3500):
     if not s:
         return []
     return [s[i:i+n] for i in range(0, len(s), n)]
 
+# =========================
+# SUBSCRIPTIONS & FAN-OUT (one computation → many chats)
+# =========================
+ALERT_TYPES          = ("entry", "momentum", "info", "error")
+DEFAULT_ALERTS       = ("entry", "momentum")
+FANOUT_WORKERS       = int(os.getenv("FANOUT_WORKERS", "8"))
+FANOUT_BATCH         = int(os.getenv("FANOUT_BATCH", "25"))          # chats per batch
+FANOUT_BATCH_PAUSE   = float(os.getenv("FANOUT_BATCH_PAUSE", "1.0")) # s between batches (Telegram ~30 msg/s)
+FANOUT_QUEUE_MAX     = int(os.getenv("FANOUT_QUEUE_MAX", "200"))     # pending messages before new ones drop
+
+_fanout_pool = None
+_fanout_q = queue.Queue(maxsize=FANOUT_QUEUE_MAX)
+_fanout_thread = None
+_fanout_lock = threading.Lock()
+
+def _load_subs() -> dict:
+    try:
+        if not os.path.exists(SUBSCRIBERS_FILE):
+            return {}
+        data = json.load(open(SUBSCRIBERS_FILE, "r"))
+        return data if isinstance(data, dict) else {}
+    except Exception:
+        return {}
+
+def subscribe(chat_id, symbols=None, alerts=None) -> dict:
+    """Create/replace a chat's subscription. Unknown alert types are ignored."""
+    alerts = [a for a in (alerts or DEFAULT_ALERTS) if a in ALERT_TYPES] or list(DEFAULT_ALERTS)
+    symbols = [x.upper() for x in (symbols or [SYMBOL])]
+    sub = {"symbols": symbols, "alerts": alerts, "since": _now_iso()}
+    with _state_lock():
+        subs = _load_subs()
+        subs[str(chat_id)] = sub
+        _atomic_dump(SUBSCRIBERS_FILE, subs)
+    return sub
+
+def unsubscribe(chat_id) -> bool:
+    with _state_lock():
+        subs = _load_subs()
+        if subs.pop(str(chat_id), None) is None:
+            return False
+        _atomic_dump(SUBSCRIBERS_FILE, subs)
+    return True
+
+def subscribers_for(alert: str, symbol: str = SYMBOL) -> list:
+    """Chat ids subscribed to `alert` on `symbol`; OWNER_CHAT_ID always receives everything."""
+    symbol = symbol.upper()
+    out = [cid for cid, sub in _load_subs().items()
+           if alert in sub.get("alerts", ()) and symbol in sub.get("symbols", ())]
+    owner = os.getenv("OWNER_CHAT_ID")
+    if owner and owner not in out:
+        out.append(owner)
+    return out
+
+def broadcast(bot, text: str, alert: str = "entry", symbol: str = SYMBOL, exclude=None) -> int:
+    """
+    Queue an already-computed message for every matching subscriber and
+    return at once; the fan-out sender thread delivers it. Returns chats
+    queued (0 if none match or the queue is full).
+    """
+    global _fanout_thread
+    if not text:
+        return 0
+    chats = [c for c in subscribers_for(alert, symbol) if c != str(exclude)]
+    if not chats:
+        return 0
+    with _fanout_lock:
+        if _fanout_thread is None or not _fanout_thread.is_alive():
+            _fanout_thread = threading.Thread(target=_fanout_loop, name="fanout-sender", daemon=True)
+            _fanout_thread.start()
+    try:
+        _fanout_q.put_nowait((bot, _chunk_text(text), chats))
+    except queue.Full:
+        return 0   # sender is FANOUT_QUEUE_MAX messages behind; drop rather than block the caller
+    return len(chats)
+
+def _fanout_send(bot, chunks: list, cid) -> bool:
+    try:
+        for chunk in chunks:
+            bot.send_message(chat_id=cid, text=chunk)
+        return True
+    except Exception as e:
+        if type(e).__name__ in ("Unauthorized", "Forbidden"):
+            unsubscribe(cid)   # chat blocked the bot
+        return False
+
+def _fanout_loop():
+    """
+    Single sender: messages go out in the order they were queued, FANOUT_BATCH
+    chats at a time on a bounded pool, at most one batch per FANOUT_BATCH_PAUSE
+    across all messages.
+    """
+    global _fanout_pool
+    _fanout_pool = _fanout_pool or ThreadPoolExecutor(max_workers=FANOUT_WORKERS, thread_name_prefix="fanout")
+    last_batch = 0.0
+    while True:
+        bot, chunks, chats = _fanout_q.get()
+        try:
+            for i in range(0, len(chats), FANOUT_BATCH):
+                wait = FANOUT_BATCH_PAUSE - (time.time() - last_batch)
+                if wait > 0:
+                    time.sleep(wait)
+                last_batch = time.time()
+                list(_fanout_pool.map(lambda cid: _fanout_send(bot, chunks, cid), chats[i:i+FANOUT_BATCH]))
+        except Exception:
+            pass
+        finally:
+            _fanout_q.task_done()
+
 def start_background(bot):
     """
     Launch background threads:
       - scan loop: calls scan_market() every SCAN_INTERVAL_SEC (default 60s)
       - momentum loop: calls momentum_ping() every PING_INTERVAL_SEC if defined
-    Sends output to OWNER_CHAT_ID if set.
+    Each result is computed once and queued via broadcast() for
+    OWNER_CHAT_ID and every matching subscriber, so slow fan-outs never
+    delay the next scan or exit check.
+
+    Safe to call from every web worker: only the process holding
+    LEADER_LOCK_FILE runs the loops; the others poll and take over if it dies.
     """
     global __bg_started
     if __bg_started:
         return
     __bg_started = True
 
-    owner = os.getenv("OWNER_CHAT_ID")
     scan_every = int(os.getenv("SCAN_INTERVAL_SEC", "60"))
     ping_every = int(os.getenv("PING_INTERVAL_SEC", "60"))
 
@@ -589,39 +1367,44 @@ def start_background(bot):
     def _scan_loop():
         while True:
             try:
-                result = scan_market()           # must return (header, detail) or (text, None)
+                result = scan_market()           # returns (text, opened)
                 if isinstance(result, tuple):
-                    header, detail = result
+                    header, opened = result
                 else:
-                    header, detail = str(result), None
+                    header, opened = str(result), False
 
-                if owner and header:
-                    bot.send_message(chat_id=owner, text=header)
-                    if detail:
-                        for chunk in _chunk_text(detail):
-                            bot.send_message(chat_id=owner, text=chunk)
+                # while MEXC is degraded the breaker alert below replaces per-tick noise
+                if opened is True or not data_degraded():
+                    broadcast(bot, header, "entry" if opened is True else "info")
             except Exception as e:
-                if owner:
-                    bot.send_message(chat_id=owner, text=f"❌ Auto-scan error: {e}")
+                broadcast(bot, f"❌ Auto-scan error: {e}", "error")
+            for alert in pop_data_alerts():
+                broadcast(bot, alert, "error")
             time.sleep(scan_every)
 
     # --- momentum loop (optional) ---
     def _momo_loop():
         # If you have a momentum_ping() in utils, we’ll use it; otherwise this thread idles
-        ping_fn = globals().get("momentum_ping")
+        ping_fn = globals().get("momentum_ping") or globals().get("momentum_pulse")
         if not callable(ping_fn):
             return
         while True:
             try:
                 text = ping_fn()
-                if owner and text:
-                    for chunk in _chunk_text(text):
-                        bot.send_message(chat_id=owner, text=chunk)
+                if text:
+                    broadcast(bot, text, "momentum")
             except Exception as e:
-                if owner:
-                    bot.send_message(chat_id=owner, text=f"❌ Momentum ping error: {e}")
+                broadcast(bot, f"❌ Momentum ping error: {e}", "error")
+            for alert in pop_data_alerts():
+                broadcast(bot, alert, "error")
             time.sleep(ping_every)
 
-    threading.Thread(target=_scan_loop, daemon=True).start()
-    threading.Thread(target=_momo_loop, daemon=True).start()
+    # --- leader election: first process to lock LEADER_LOCK_FILE runs the loops ---
+    def _elect_loop():
+        while not _try_become_leader():
+            time.sleep(LEADER_POLL_SEC)
+        threading.Thread(target=_scan_loop, daemon=True).start()
+        threading.Thread(target=_momo_loop, daemon=True).start()
+
+    threading.Thread(target=_elect_loop, daemon=True).start()
 